@@ -1,19 +1,32 @@
-from fastapi import FastAPI, Request, Header, HTTPException, Query
+from fastapi import FastAPI, Request, Header, HTTPException
 import os
 import hmac
-import hashlib
 import base64
 import logging
-import json
 import time
+import asyncio
 import threading
+import httpx
+import orjson
+import msgspec
 import requests
-from typing import Optional, Dict, Any
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from contextlib import asynccontextmanager
+from typing import Optional, Dict, Any, List
 
 # =========================================================
 # App
 # =========================================================
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await _open_http_client()
+    try:
+        yield
+    finally:
+        await _close_http_client()
+
+app = FastAPI(lifespan=lifespan)
 logging.basicConfig(level=logging.INFO)
 
 # =========================================================
@@ -26,16 +39,83 @@ LINE_CHANNEL_SECRET = os.getenv("LINE_CHANNEL_SECRET")
 LINE_CHANNEL_ACCESS_TOKEN = os.getenv("LINE_CHANNEL_ACCESS_TOKEN")
 
 CWA_API_KEY = os.getenv("CWA_API_KEY")
+CWA_CACHE_TTL = int(os.getenv("CWA_CACHE_TTL", "300"))
+# CWA 失敗時的短暫負快取，避免故障期間同一 dataset 一直重打
+CWA_ERROR_TTL = int(os.getenv("CWA_ERROR_TTL", "15"))
 
 LINE_REPLY_API = "https://api.line.me/v2/bot/message/reply"
 LINE_PUSH_API = "https://api.line.me/v2/bot/message/push"
 
 LINE_DELIVERY_MODE = os.getenv("LINE_DELIVERY_MODE", "ack_push").lower()
 LINE_MAX_CHARS = int(os.getenv("LINE_MAX_CHARS", "800"))
+# 單次 reply/push 最多 5 則訊息；超過 LINE_MAX_CHARS 的回答可切成多則
+LINE_MAX_MESSAGES = max(1, min(5, int(os.getenv("LINE_MAX_MESSAGES", "1"))))
 
 ACK_TEXT = os.getenv("ACK_TEXT", "收到，我查一下（約 10 秒）。")
 BUSY_TEXT = os.getenv("BUSY_TEXT", "AI 服務忙碌中，請稍後再試")
 
+# Dify 整體時限（httpx timeout 只管單次讀取）
+DIFY_DEADLINE_SECONDS = float(os.getenv("DIFY_DEADLINE_SECONDS", "120"))
+# ack_push：Dify 在此秒數內回來就不送 ACK，直接 reply 答案
+ACK_DELAY_SECONDS = float(os.getenv("ACK_DELAY_SECONDS", "1.5"))
+# reply_once：超過此秒數先用 reply token 回 ACK，答案改 push
+NO_TOKEN_FALLBACK_SECONDS = float(os.getenv("NO_TOKEN_FALLBACK_SECONDS", "25"))
+# 每個 worker 同時進行的 Dify 呼叫上限，超過的排隊（排隊時間也算在整體時限內）
+DIFY_CONCURRENCY = int(os.getenv("DIFY_CONCURRENCY", "32"))
+
+# 固定值在 import 時算好，避免每個 webhook 重複 encode / 組 dict
+_LINE_SECRET_BYTES = LINE_CHANNEL_SECRET.encode("utf-8") if LINE_CHANNEL_SECRET else None
+_DIFY_HEADERS = {
+    "Authorization": f"Bearer {DIFY_API_KEY}",
+    "Content-Type": "application/json",
+}
+_LINE_HEADERS = {
+    "Authorization": f"Bearer {LINE_CHANNEL_ACCESS_TOKEN}",
+    "Content-Type": "application/json",
+}
+
+# =========================================================
+# Outbound HTTP (shared async client, per process)
+# =========================================================
+http_client: Optional[httpx.AsyncClient] = None
+
+async def _open_http_client():
+    global http_client
+    # HTTP/2：同一批事件的多個 Dify / LINE 呼叫可共用一條連線
+    http_client = httpx.AsyncClient(
+        http2=True,
+        # Dify 串流兩個 chunk 之間可能停很久，read 放寬；整體時限另由 DIFY_DEADLINE_SECONDS 控制
+        timeout=httpx.Timeout(60.0, connect=15.0, read=180.0),
+        limits=httpx.Limits(
+            max_keepalive_connections=50,
+            max_connections=100,
+            keepalive_expiry=30,
+        ),
+    )
+
+async def _close_http_client():
+    if http_client is not None:
+        await http_client.aclose()
+
+# sync endpoint（threadpool）用的連線池，重用 TLS 連線
+SESSION = requests.Session()
+SESSION.mount("https://", HTTPAdapter(
+    pool_connections=20,
+    pool_maxsize=50,
+    max_retries=Retry(total=2, backoff_factor=0.1, status_forcelist=[502, 503, 504]),
+))
+
+_DIFY_SLOTS = asyncio.Semaphore(DIFY_CONCURRENCY)
+
+# 背景 task 需保留參照，避免被 GC 提前回收
+_BACKGROUND_TASKS = set()
+
+def _spawn(coro):
+    task = asyncio.create_task(coro)
+    _BACKGROUND_TASKS.add(task)
+    task.add_done_callback(_BACKGROUND_TASKS.discard)
+    return task
+
 # =========================================================
 # Location normalize & dataset mapping
 # =========================================================
@@ -89,16 +169,26 @@ DATASET_MAP = {
     "連江縣": {"3days": "F-D0047-081", "1week": "F-D0047-083"},
 }
 
+# (location, range) → dataset，一次查表
+DATASET_FLAT = {
+    (loc, rng): ds
+    for loc, ranges in DATASET_MAP.items()
+    for rng, ds in ranges.items()
+}
+
+WEEK_RANGES = frozenset({"week", "1week", "7days"})
+
 def normalize_location(raw: str) -> str:
     raw = raw.strip()
-    if raw in LOCATION_ALIAS:
-        return LOCATION_ALIAS[raw]
-    raise HTTPException(status_code=400, detail=f"unsupported location: {raw}")
+    location = LOCATION_ALIAS.get(raw)
+    if location is None:
+        raise HTTPException(status_code=400, detail=f"unsupported location: {raw}")
+    return location
 
 def select_dataset(location: str, time_range: str) -> str:
-    if time_range in ["week", "1week", "7days"]:
-        return DATASET_MAP[location]["1week"]
-    return DATASET_MAP[location]["3days"]
+    # JSON body 可能傳 list / dict（unhashable），非字串一律當 3days
+    rng = "1week" if isinstance(time_range, str) and time_range in WEEK_RANGES else "3days"
+    return DATASET_FLAT[(location, rng)]
 
 # =========================================================
 # Health
@@ -112,62 +202,154 @@ def health():
 # =========================================================
 # LINE signature verify
 # =========================================================
+SIGNATURE_OFFLOAD_BYTES = 256 * 1024
+
 def verify_line_signature(body: bytes, signature: Optional[str]) -> bool:
-    if not signature or not LINE_CHANNEL_SECRET:
+    if not signature or not _LINE_SECRET_BYTES:
+        return False
+    # one-shot HMAC，直接走 OpenSSL C 實作
+    mac = hmac.digest(_LINE_SECRET_BYTES, body, "sha256")
+    try:
+        provided = base64.b64decode(signature, validate=True)
+    except ValueError:
+        # binascii.Error 是 ValueError 子類；非 ASCII header 則直接丟 ValueError
         return False
-    mac = hmac.new(
-        LINE_CHANNEL_SECRET.encode("utf-8"),
-        body,
-        hashlib.sha256
-    ).digest()
-    expected = base64.b64encode(mac).decode()
-    return hmac.compare_digest(expected, signature)
+    return hmac.compare_digest(mac, provided)
+
+# =========================================================
+# LINE webhook payload (只宣告用得到的欄位，其餘忽略)
+# =========================================================
+class LineMessage(msgspec.Struct):
+    type: str = ""
+    text: str = ""
+
+class LineSource(msgspec.Struct):
+    userId: str = ""
+    groupId: str = ""
+    roomId: str = ""
+
+class LineEvent(msgspec.Struct):
+    type: str = ""
+    replyToken: str = ""
+    message: LineMessage = msgspec.field(default_factory=LineMessage)
+    source: LineSource = msgspec.field(default_factory=LineSource)
+
+class LineWebhook(msgspec.Struct):
+    events: List[LineEvent] = msgspec.field(default_factory=list)
+
+_LINE_WEBHOOK_DECODER = msgspec.json.Decoder(LineWebhook)
 
 # =========================================================
 # Helpers
 # =========================================================
+_TRUNC_SUFFIX = "\n（內容過長已截斷）"
+_TRUNC_KEEP = LINE_MAX_CHARS - len(_TRUNC_SUFFIX)
+
 def _truncate_for_line(text: str) -> str:
-    text = (text or "").strip()
+    # 呼叫端（_line_text_messages）已 strip 過
     if len(text) <= LINE_MAX_CHARS:
         return text
-    suffix = "\n（內容過長已截斷）"
-    keep = LINE_MAX_CHARS - len(suffix)
-    return text[:keep].rstrip() + suffix
+    return text[:_TRUNC_KEEP].rstrip() + _TRUNC_SUFFIX
 
-def _line_headers() -> Dict[str, str]:
-    return {
-        "Authorization": f"Bearer {LINE_CHANNEL_ACCESS_TOKEN}",
-        "Content-Type": "application/json",
-    }
+def _line_text_messages(text: str) -> List[Dict[str, str]]:
+    text = (text or "").strip()
+    messages = []
+    while len(messages) < LINE_MAX_MESSAGES - 1 and len(text) > LINE_MAX_CHARS:
+        messages.append({"type": "text", "text": text[:LINE_MAX_CHARS]})
+        text = text[LINE_MAX_CHARS:].lstrip()
+    messages.append({"type": "text", "text": _truncate_for_line(text)})
+    return messages
 
-def _extract_push_to_id(source: Dict[str, Any]) -> str:
-    return source.get("userId") or source.get("groupId") or source.get("roomId") or ""
+def _extract_push_to_id(source: "LineSource") -> str:
+    return source.userId or source.groupId or source.roomId
 
-def line_reply(reply_token: str, text: str):
+async def line_reply(reply_token: str, text: str) -> bool:
     if not reply_token:
-        return
-    requests.post(
-        LINE_REPLY_API,
-        headers=_line_headers(),
-        json={
-            "replyToken": reply_token,
-            "messages": [{"type": "text", "text": _truncate_for_line(text)}],
-        },
-        timeout=8,
-    )
+        return False
+    try:
+        resp = await http_client.post(
+            LINE_REPLY_API,
+            headers=_LINE_HEADERS,
+            content=orjson.dumps({
+                "replyToken": reply_token,
+                "messages": _line_text_messages(text),
+            }),
+            timeout=8,
+        )
+    except httpx.HTTPError as e:
+        logging.warning("LINE reply error: %r", e)
+        return False
+    if resp.status_code != 200:
+        logging.warning("LINE reply failed %s: %s", resp.status_code, resp.text)
+        return False
+    return True
 
-def line_push(to_id: str, text: str):
+async def line_push(to_id: str, text: str) -> bool:
     if not to_id:
-        return
-    requests.post(
-        LINE_PUSH_API,
-        headers=_line_headers(),
-        json={
-            "to": to_id,
-            "messages": [{"type": "text", "text": _truncate_for_line(text)}],
-        },
-        timeout=10,
-    )
+        return False
+    try:
+        resp = await http_client.post(
+            LINE_PUSH_API,
+            headers=_LINE_HEADERS,
+            content=orjson.dumps({
+                "to": to_id,
+                "messages": _line_text_messages(text),
+            }),
+            timeout=10,
+        )
+    except httpx.HTTPError as e:
+        logging.warning("LINE push error: %r", e)
+        return False
+    if resp.status_code != 200:
+        logging.warning("LINE push failed %s: %s", resp.status_code, resp.text)
+        return False
+    return True
+
+# =========================================================
+# CWA fetch cache (TTL + single-flight)
+# =========================================================
+_CWA_CACHE: Dict[str, Dict[str, Any]] = {}
+_CWA_LOCKS: Dict[str, threading.Lock] = {}
+
+def _get_cwa_cache(dataset_id: str) -> Optional[bytes]:
+    entry = _CWA_CACHE.get(dataset_id)
+    if not entry:
+        return None
+    ttl = CWA_ERROR_TTL if "error" in entry else CWA_CACHE_TTL
+    if time.time() - entry["ts"] > ttl:
+        return None
+    # 剛失敗過：等待中的 request 共用同一個錯誤，不再各自重打 CWA
+    if "error" in entry:
+        raise entry["error"]
+    return entry["data"]
+
+def fetch_cwa_dataset(dataset_id: str) -> bytes:
+    cached = _get_cwa_cache(dataset_id)
+    if cached is not None:
+        return cached
+
+    # 同一 dataset 同時 miss 時只打一次 CWA，其餘等結果
+    lock = _CWA_LOCKS.setdefault(dataset_id, threading.Lock())
+    with lock:
+        cached = _get_cwa_cache(dataset_id)
+        if cached is not None:
+            return cached
+
+        url = f"https://opendata.cwa.gov.tw/api/v1/rest/datastore/{dataset_id}"
+        try:
+            resp = SESSION.get(
+                url,
+                params={"Authorization": CWA_API_KEY},
+                timeout=10,
+            )
+            resp.raise_for_status()
+        except requests.RequestException as e:
+            _CWA_CACHE[dataset_id] = {"ts": time.time(), "error": e}
+            raise
+        # 目前沒人讀預報內容，先存原始 bytes，要用時再解析
+        data = resp.content
+        _CWA_CACHE[dataset_id] = {"ts": time.time(), "data": data}
+        return data
 
 # =========================================================
 # Weather Tool API (REAL CWA)
@@ -186,13 +368,7 @@ def tool_weather(payload: Dict[str, Any]):
     location = normalize_location(location_raw)
     dataset_id = select_dataset(location, time_range)
 
-    url = f"https://opendata.cwa.gov.tw/api/v1/rest/datastore/{dataset_id}"
-    resp = requests.get(
-        url,
-        params={"Authorization": CWA_API_KEY},
-        timeout=10,
-    )
-    resp.raise_for_status()
+    fetch_cwa_dataset(dataset_id)
 
     # 👉 此處先給穩定摘要（後續可解析 PoP / Wx 強化）
     return {
@@ -207,9 +383,129 @@ def tool_weather(payload: Dict[str, Any]):
 
 
 # =========================================================
-# Dify Workflow Call (blocking)
+# Dify Workflow Call (streaming)
 # =========================================================
-def dify_call_workflow(query: str, user_id: str) -> str:
+# 用不到的生命週期事件（node_finished 常帶整包節點輸出），不解析 JSON 直接跳過
+DIFY_IGNORE_EVENTS = frozenset({
+    "ping",
+    "workflow_started",
+    "node_started", "node_finished",
+    "iteration_started", "iteration_next", "iteration_completed",
+    "loop_started", "loop_next", "loop_completed",
+    "parallel_branch_started", "parallel_branch_finished",
+    "agent_log", "tts_message", "tts_message_end",
+})
+
+_SSE_EVENT_PREFIXES = (b'{"event": "', b'{"event":"')
+
+def _peek_sse_event(raw: bytes) -> str:
+    # Dify 的 data JSON 以 "event" 開頭，先從 bytes 取事件名
+    for prefix in _SSE_EVENT_PREFIXES:
+        if raw.startswith(prefix):
+            end = raw.find(b'"', len(prefix))
+            if end > 0:
+                return raw[len(prefix):end].decode("utf-8", "replace")
+    return ""
+
+async def _aiter_sse_lines(resp: httpx.Response):
+    # 直接切 bytes：網路讀到多少就處理多少，只有 data 內容交給 orjson 解碼
+    buf = bytearray()
+    async for chunk in resp.aiter_bytes():
+        buf += chunk
+        start = 0
+        while True:
+            nl = buf.find(b"\n", start)
+            if nl < 0:
+                break
+            end = nl - 1 if nl > start and buf[nl - 1] == 0x0D else nl
+            yield bytes(buf[start:end])
+            start = nl + 1
+        del buf[:start]
+    if buf:
+        yield bytes(buf)
+
+async def _dify_stream_workflow(payload: Dict[str, Any]) -> str:
+    async with _DIFY_SLOTS, http_client.stream(
+        "POST",
+        DIFY_API_URL,
+        headers=_DIFY_HEADERS,
+        content=orjson.dumps(payload),
+    ) as resp:
+        if resp.status_code != 200:
+            await resp.aread()
+            logging.error("❌ Dify workflow error %s: %s",
+                          resp.status_code, resp.text)
+            return BUSY_TEXT
+
+        parts = []
+        # SSE 逐行累積欄位，遇空行才組成一個事件並解析
+        event_name = ""
+        data_lines = []
+        async for line in _aiter_sse_lines(resp):
+            if line:
+                if line.startswith(b"data:"):
+                    # SSE 規格只去掉冒號後的一個空白，payload 其餘不動
+                    value = line[5:]
+                    data_lines.append(value[1:] if value[:1] == b" " else value)
+                elif line.startswith(b"event:"):
+                    event_name = line[6:].strip().decode("utf-8", "replace")
+                continue
+
+            if not data_lines:
+                event_name = ""
+                continue
+            raw = b"\n".join(data_lines)
+            ev_name = event_name or _peek_sse_event(raw)
+            event_name, data_lines = "", []
+            if ev_name in DIFY_IGNORE_EVENTS:
+                continue
+            try:
+                evt = orjson.loads(raw)
+            except orjson.JSONDecodeError:
+                logging.warning("Dify SSE bad json (event=%s): %s", ev_name,
+                                raw[:200].decode("utf-8", "replace"))
+                continue
+            if not isinstance(evt, dict):
+                continue
+
+            # 絕大多數是 text_chunk：已知事件名就直接取 data.text
+            if ev_name == "text_chunk":
+                text = (evt.get("data") or {}).get("text")
+                if isinstance(text, str) and text:
+                    parts.append(text)
+                continue
+
+            event = evt.get("event") or ev_name
+            data = evt.get("data") or {}
+
+            if event == "text_chunk":
+                parts.append(data.get("text") or "")
+
+            elif event == "workflow_finished":
+                # 以最終 outputs 為準，沒有才用累積的 text_chunk
+                text = (data.get("outputs") or {}).get("text")
+                text = text.strip() if isinstance(text, str) else ""
+                if not text:
+                    text = "".join(parts).strip()
+                if text:
+                    return text
+                logging.error("❌ Workflow output missing: status=%s error=%s",
+                              data.get("status"), data.get("error"))
+                if logging.getLogger().isEnabledFor(logging.DEBUG):
+                    logging.debug("Workflow finished payload: %s", data)
+                return BUSY_TEXT
+
+            elif event == "error":
+                logging.error("❌ Dify stream error: %s", evt)
+                return BUSY_TEXT
+
+    text = "".join(parts).strip()
+    if text:
+        return text
+    logging.error("❌ Dify stream ended without workflow_finished")
+    return BUSY_TEXT
+
+async def dify_call_workflow(query: str, user_id: str) -> str:
     if not DIFY_API_KEY:
         return "（DIFY_API_KEY 未設定）"
 
@@ -217,38 +513,17 @@ def dify_call_workflow(query: str, user_id: str) -> str:
         "inputs": {
             "query": query
         },
-        "response_mode": "blocking",
+        "response_mode": "streaming",
         "user": user_id,
     }
 
-    headers = {
-        "Authorization": f"Bearer {DIFY_API_KEY}",
-        "Content-Type": "application/json",
-    }
-
     try:
-        resp = requests.post(
-            DIFY_API_URL,
-            headers=headers,
-            json=payload,
-            timeout=120,
+        return await asyncio.wait_for(
+            _dify_stream_workflow(payload), timeout=DIFY_DEADLINE_SECONDS
         )
-
-        if resp.status_code != 200:
-            logging.error("❌ Dify workflow error %s: %s",
-                          resp.status_code, resp.text)
-            return BUSY_TEXT
-
-        data = resp.json()
-        outputs = data.get("data", {}).get("outputs", {})
-
-        text = outputs.get("text")
-        if isinstance(text, str) and text.strip():
-            return _truncate_for_line(text)
-
-        logging.error("❌ Workflow output missing: %s", data)
+    except asyncio.TimeoutError:
+        logging.error("❌ Dify workflow exceeded %ss deadline", DIFY_DEADLINE_SECONDS)
         return BUSY_TEXT
-
     except Exception:
         logging.exception("❌ Dify workflow exception")
         return BUSY_TEXT
@@ -256,13 +531,33 @@ def dify_call_workflow(query: str, user_id: str) -> str:
 # =========================================================
 # Background workers
 # =========================================================
-def background_replyonce(query: str, user_id: str, reply_token: str):
-    ans = dify_call_workflow(query, user_id)
-    line_reply(reply_token, ans)
+async def _deliver_answer(query: str, user_id: str, reply_token: str,
+                          push_to: str, ack_after: float):
+    task = asyncio.ensure_future(dify_call_workflow(query, user_id))
+    try:
+        ans = await asyncio.wait_for(asyncio.shield(task), timeout=ack_after)
+    except asyncio.TimeoutError:
+        # 等太久：先用 reply token 回 ACK（失敗也不影響），答案好了再 push
+        try:
+            await line_reply(reply_token, ACK_TEXT)
+        except Exception:
+            logging.exception("LINE ACK reply exception")
+        await line_push(push_to, await task)
+        return
 
-def background_ackpush(query: str, user_id: str, push_to: str):
-    ans = dify_call_workflow(query, user_id)
-    line_push(push_to, ans)
+    # Dify 夠快就直接用 reply 回答案；reply token 失效則改 push
+    if not await line_reply(reply_token, ans):
+        await line_push(push_to, ans)
+
+async def background_replyonce(query: str, user_id: str,
+                               reply_token: str, push_to: str):
+    await _deliver_answer(query, user_id, reply_token, push_to,
+                          NO_TOKEN_FALLBACK_SECONDS)
+
+async def background_ackpush(query: str, user_id: str,
+                             reply_token: str, push_to: str):
+    await _deliver_answer(query, user_id, reply_token, push_to,
+                          ACK_DELAY_SECONDS)
 
 # =========================================================
 # LINE Webhook
@@ -271,45 +566,42 @@ def background_ackpush(query: str, user_id: str, push_to: str):
 async def line_webhook(request: Request,
                        x_line_signature: str = Header(None)):
     body = await request.body()
-    if not verify_line_signature(body, x_line_signature):
+    # 一般 LINE body 只有幾 KB，直接在 loop 上驗簽比丟 thread 便宜；大 body 才 offload
+    if len(body) > SIGNATURE_OFFLOAD_BYTES:
+        valid = await asyncio.to_thread(verify_line_signature, body, x_line_signature)
+    else:
+        valid = verify_line_signature(body, x_line_signature)
+    if not valid:
         raise HTTPException(status_code=403, detail="Invalid signature")
 
-    payload = await request.json()
-    events = payload.get("events", [])
+    # LINE 的 verify / 空事件：驗簽後直接回，不必解析 JSON
+    if b'"events":[]' in body or b'"events": []' in body:
+        return {"status": "ok"}
 
-    for event in events:
-        if event.get("type") != "message":
-            continue
+    # 驗簽與解析共用同一份 bytes，一次 decode + 驗證結構
+    try:
+        payload = _LINE_WEBHOOK_DECODER.decode(body)
+    except msgspec.DecodeError:
+        raise HTTPException(status_code=400, detail="Invalid payload")
 
-        message = event.get("message", {})
-        if message.get("type") != "text":
+    for event in payload.events:
+        if event.type != "message" or event.message.type != "text":
             continue
 
-        user_text = (message.get("text") or "").strip()
+        user_text = event.message.text.strip()
         if not user_text:
             continue
 
-        reply_token = event.get("replyToken", "")
-        source = event.get("source", {})
-        user_id = source.get("userId", "unknown-user")
-        push_to = _extract_push_to_id(source)
+        reply_token = event.replyToken
+        user_id = event.source.userId or "unknown-user"
+        push_to = _extract_push_to_id(event.source)
 
         logging.info("LINE user=%s text=%s", user_id, user_text)
 
+        # webhook 本身不做任何對外 IO，立即回 200 給 LINE
         if LINE_DELIVERY_MODE == "reply_once":
-            threading.Thread(
-                target=background_replyonce,
-                args=(user_text, user_id, reply_token),
-                daemon=True,
-            ).start()
+            _spawn(background_replyonce(user_text, user_id, reply_token, push_to))
         else:
-            if reply_token:
-                line_reply(reply_token, ACK_TEXT)
-            if push_to:
-                threading.Thread(
-                    target=background_ackpush,
-                    args=(user_text, user_id, push_to),
-                    daemon=True,
-                ).start()
+            _spawn(background_ackpush(user_text, user_id, reply_token, push_to))
 
     return {"status": "ok"}
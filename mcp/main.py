@@ -1,9 +1,16 @@
-from fastapi import FastAPI, Body
-import boto3
+from fastapi import FastAPI, Header, HTTPException, Request, Response
+from fastapi.middleware.gzip import GZipMiddleware
+import aioboto3
+import asyncio
+import hashlib
+import hmac
+import math
 import os
 import time
-from datetime import datetime, timedelta
-from typing import Dict, Any
+from datetime import date, datetime, timedelta, timezone
+from collections import OrderedDict
+from typing import Annotated, Dict, Any, Hashable, List, Literal
+from pydantic import BaseModel, ConfigDict, Field
 
 # =====================================================
 # App
@@ -14,37 +21,131 @@ app = FastAPI(
     version="0.1.0",
 )
 
+# =====================================================
+# ETag / If-None-Match（重複輪詢時回 304，不送 body）
+# =====================================================
+ETAG_PATHS = frozenset({
+    "/",
+    "/mcp/get_service_health",
+    "/mcp/get_service_health_batch",
+    "/mcp/get_cost_projection",
+    "/mcp/overview",
+})
+
+
+def _etag_matches(if_none_match: str, opaque: str) -> bool:
+    # If-None-Match 用 weak comparison：有沒有 W/ 前綴都算相符
+    return any(
+        tag.strip() in (opaque, "*", f"W/{opaque}")
+        for tag in if_none_match.split(",")
+    )
+
+
+@app.middleware("http")
+async def etag_middleware(request: Request, call_next):
+    response = await call_next(request)
+    if request.url.path not in ETAG_PATHS or response.status_code != 200:
+        return response
+
+    body = b"".join([chunk async for chunk in response.body_iterator])
+    opaque = f'"{hashlib.blake2b(body, digest_size=8).hexdigest()}"'
+    # weak：外層 gzip 會改 content-coding，同一個 tag 不能當 strong validator
+    etag = f"W/{opaque}"
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and _etag_matches(if_none_match, opaque):
+        headers = {"ETag": etag}
+        if "cache-control" in response.headers:
+            headers["Cache-Control"] = response.headers["cache-control"]
+        return Response(status_code=304, headers=headers)
+
+    headers = dict(response.headers)
+    headers["etag"] = etag
+    return Response(
+        content=body,
+        status_code=response.status_code,
+        headers=headers,
+    )
+
+
+# 最後註冊 = 最外層：ETag 先算未壓縮 body，再由 gzip 壓縮
+app.add_middleware(GZipMiddleware, minimum_size=256, compresslevel=5)
+
+
 # =====================================================
 # Environment (防呆)
 # =====================================================
 AWS_REGION = os.getenv("AWS_REGION", "ap-northeast-1")
+# 呼叫 /mcp/_invalidate 用；未設定則該 endpoint 關閉
+MCP_ADMIN_TOKEN = os.getenv("MCP_ADMIN_TOKEN")
 
 # =====================================================
-# TTL Cache (in-memory, MVP 專用)
+# LRU + TTL Cache (in-memory, MVP 專用)
 # =====================================================
-_CACHE: Dict[str, Dict[str, Any]] = {}
-TTL_SECONDS = 120  # 2 minutes
+# 全部在 event loop 上存取，不需要 lock
+_CACHE: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+TTL_SECONDS = 120  # 2 minutes（預設）
+HEALTH_TTL_SECONDS = 60
+COST_TTL_SECONDS = 3600  # Cost Explorer 資料一天才更新幾次
+CACHE_MAX_ENTRIES = 4096
+
+# 給 CDN / ALB / proxy 的快取標頭，與上面的 TTL 對齊
+HEALTH_CACHE_CONTROL = f"public, max-age={HEALTH_TTL_SECONDS}, stale-while-revalidate=30"
+COST_CACHE_CONTROL = f"public, max-age={COST_TTL_SECONDS}, stale-while-revalidate=300"
 
 
 def get_cache(key: str):
     entry = _CACHE.get(key)
     if not entry:
         return None
-    if time.time() - entry["ts"] > TTL_SECONDS:
+    if time.time() > entry["expires_at"]:
         del _CACHE[key]
         return None
+    _CACHE.move_to_end(key)
     return entry["data"]
 
 
-def set_cache(key: str, data: Any):
-    _CACHE[key] = {"ts": time.time(), "data": data}
+def set_cache(key: str, data: Any, ttl: int = TTL_SECONDS):
+    if key in _CACHE:
+        _CACHE.move_to_end(key)
+    elif len(_CACHE) >= CACHE_MAX_ENTRIES:
+        _CACHE.popitem(last=False)
+    _CACHE[key] = {"expires_at": time.time() + ttl, "data": data}
+
+
+def invalidate_cache(prefix: str) -> int:
+    keys = [k for k in _CACHE if k.startswith(prefix)]
+    for k in keys:
+        _CACHE.pop(k, None)
+    return len(keys)
+
+
+# =====================================================
+# Single-flight：同 key 同時 miss 只打一次 AWS，其餘等同一個結果
+# =====================================================
+_INFLIGHT: Dict[Hashable, "asyncio.Task"] = {}
+
+
+async def single_flight(key: Hashable, fetch):
+    task = _INFLIGHT.get(key)
+    if task is None:
+        task = asyncio.ensure_future(fetch())
+        _INFLIGHT[key] = task
+        task.add_done_callback(lambda _: _INFLIGHT.pop(key, None))
+    # shield：單一 client 斷線不會取消其他人在等的 fetch
+    return await asyncio.shield(task)
 
 
 # =====================================================
 # AWS Client Factories (❗重點：不要在 module level 建 client)
 # =====================================================
+# Session 共用（credential / endpoint 資料只載入一次），client 仍每次 async with 開關
+_AWS_SESSION = aioboto3.Session()
+
+
+# aioboto3 client 是 async context manager：用 `async with get_xxx() as c:`
 def get_cloudwatch():
-    return boto3.client(
+    return _AWS_SESSION.client(
         "cloudwatch",
         region_name=AWS_REGION,
     )
@@ -52,7 +153,7 @@ def get_cloudwatch():
 
 def get_cost_explorer():
     # ⚠️ Cost Explorer 只能在 us-east-1
-    return boto3.client(
+    return _AWS_SESSION.client(
         "ce",
         region_name="us-east-1",
     )
@@ -61,45 +162,139 @@ def get_cost_explorer():
 # =====================================================
 # Tool 1️⃣ App Runner Service Health
 # =====================================================
-@app.post("/mcp/get_service_health")
-def get_service_health(payload: dict = Body(...)):
-    """
-    Analyze App Runner service health based on CloudWatch metrics.
-    """
-    service_name = payload.get("service_name")
-    window = payload.get("window", "1h")
+HEALTH_METRICS = {
+    # query Id → App Runner metric name
+    "m_req": "Requests",
+    "m_2xx": "2xxStatusResponses",
+    "m_4xx": "4xxStatusResponses",
+    "m_5xx": "5xxStatusResponses",
+}
+
+
+# GetMetricData 每次最多 500 個 query
+MAX_METRIC_QUERIES = 500
+# batch 上限：剛好塞滿一次 GetMetricData，也避免單一 request 洗掉整個 cache
+MAX_BATCH_SERVICES = MAX_METRIC_QUERIES // len(HEALTH_METRICS)
+
+# 合法的 window / timeframe 事先建表，查表即可，不必每次 parse
+_WINDOWS = {
+    "5m": timedelta(minutes=5),
+    "15m": timedelta(minutes=15),
+    "1h": timedelta(hours=1),
+    "6h": timedelta(hours=6),
+    "24h": timedelta(hours=24),
+    "7d": timedelta(days=7),
+    "30d": timedelta(days=30),
+}
+
+
+Window = Literal["5m", "15m", "1h", "6h", "24h", "7d", "30d"]
+ServiceName = Annotated[str, Field(min_length=1)]
+
+
+class HealthReq(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+
+    service_name: ServiceName
+    window: Window = "1h"
+
+
+class HealthBatchReq(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+
+    service_names: List[ServiceName] = Field(min_length=1, max_length=MAX_BATCH_SERVICES)
+    window: Window = "1h"
+
+
+class CostReq(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+
+    timeframe: Window = "7d"
+
+
+def _health_queries(service_name: str, id_prefix: str = "", period: int = 300):
+    return [
+        {
+            "Id": f"{id_prefix}{query_id}",
+            "MetricStat": {
+                "Metric": {
+                    "Namespace": "AWS/AppRunner",
+                    "MetricName": metric_name,
+                    "Dimensions": [
+                        {"Name": "ServiceName", "Value": service_name}
+                    ],
+                },
+                "Period": period,
+                "Stat": "Sum",
+            },
+            "ReturnData": True,
+        }
+        for query_id, metric_name in HEALTH_METRICS.items()
+    ]
 
-    if not service_name:
-        return {"error": "service_name is required"}
 
-    cache_key = f"health:{service_name}:{window}"
-    cached = get_cache(cache_key)
-    if cached:
-        return cached
+def _sum_series(resp: Dict[str, Any]) -> Dict[str, float]:
+    # GetMetricData 的 Values 已是 float list，builtin sum 直接在 C 裡累加
+    return {
+        r["Id"]: float(sum(r.get("Values", ())))
+        for r in resp.get("MetricDataResults", [])
+    }
 
-    cloudwatch = get_cloudwatch()
-
-    end_time = datetime.utcnow()
-    start_time = end_time - timedelta(hours=1)
-
-    # MVP：RequestCount
-    resp = cloudwatch.get_metric_statistics(
-        Namespace="AWS/AppRunner",
-        MetricName="RequestCount",
-        Dimensions=[
-            {"Name": "ServiceName", "Value": service_name}
-        ],
-        StartTime=start_time,
-        EndTime=end_time,
-        Period=300,
-        Statistics=["Sum"],
-    )
 
-    datapoints = resp.get("Datapoints", [])
-    total_requests = sum(p["Sum"] for p in datapoints)
+async def _fetch_health_totals(service_names: List[str],
+                              window: str) -> List[Dict[str, float]]:
+    """
+    Fetch metric sums for many services, packing all queries into as few
+    GetMetricData calls as the 500-query limit allows.
+    """
+    span = _WINDOWS[window]
+    end_time = datetime.now(timezone.utc)
+    start_time = end_time - span
+    period = 300 if span <= timedelta(days=1) else 3600
+
+    queries = []
+    for idx, service_name in enumerate(service_names):
+        queries.extend(_health_queries(service_name, f"s{idx}_", period))
+
+    totals: List[Dict[str, float]] = [{} for _ in service_names]
+    async with get_cloudwatch() as cloudwatch:
+        for i in range(0, len(queries), MAX_METRIC_QUERIES):
+            kwargs = {
+                "MetricDataQueries": queries[i:i + MAX_METRIC_QUERIES],
+                "StartTime": start_time,
+                "EndTime": end_time,
+            }
+            # 長 window 的 datapoint 可能超過單頁上限，跟著 NextToken 累加
+            while True:
+                resp = await cloudwatch.get_metric_data(**kwargs)
+                for query_id, value in _sum_series(resp).items():
+                    prefix, _, metric_id = query_id.partition("_")
+                    bucket = totals[int(prefix[1:])]
+                    bucket[metric_id] = bucket.get(metric_id, 0.0) + value
+                if not resp.get("NextToken"):
+                    break
+                kwargs["NextToken"] = resp["NextToken"]
+    return totals
+
+
+# 固定內容放 module level（tuple 序列化同 JSON array），每次只組可變欄位
+_HEALTH_ACTIONS = (
+    "Check App Runner concurrency settings",
+    "Review downstream timeout",
+    "Consider auto-scaling policy",
+)
+_TRAFFIC_SPIKE = ("traffic_spike",)
+
+
+def _build_health(service_name: str, window: str, totals: Dict[str, float]):
+    total_requests = totals.get("m_req", 0.0)
+    total_2xx = totals.get("m_2xx", 0.0)
+    total_4xx = totals.get("m_4xx", 0.0)
+    total_5xx = totals.get("m_5xx", 0.0)
 
-    # ⚠️ MVP 假設 error rate（後續可拉 5XX）
-    error_rate = 0.03 if total_requests > 100 else 0.0
+    # 真實 error rate：分母用 status 回應總數，Requests 缺資料時也不會把 5XX 次數當比例
+    responses = max(total_requests, total_2xx + total_4xx + total_5xx)
+    error_rate = min(total_5xx / responses, 1.0) if responses else 0.0
 
     # 健康判斷
     system_health = "healthy"
@@ -108,90 +303,252 @@ def get_service_health(payload: dict = Body(...)):
     if error_rate > 0.05:
         system_health = "unhealthy"
 
-    result = {
+    return {
         "service": service_name,
         "window": window,
         "system_health": system_health,
         "signals": {
             "request_count": total_requests,
-            "error_rate": error_rate,
+            "status_2xx": total_2xx,
+            "status_4xx": total_4xx,
+            "status_5xx": total_5xx,
+            "error_rate": round(error_rate, 4),
         },
         "trends": {
             "traffic_trend": "rising" if total_requests > 100 else "stable"
         },
         "suspected_causes": (
-            ["traffic_spike"] if total_requests > 100 else []
+            _TRAFFIC_SPIKE if total_requests > 100 else ()
         ),
         "confidence": 0.75,
-        "recommended_actions": [
-            "Check App Runner concurrency settings",
-            "Review downstream timeout",
-            "Consider auto-scaling policy",
-        ],
+        "recommended_actions": _HEALTH_ACTIONS,
     }
 
-    set_cache(cache_key, result)
+
+async def _refresh_health(service_names: List[str], window: str):
+    fetched = await _fetch_health_totals(service_names, window)
+    results = []
+    for service_name, totals in zip(service_names, fetched):
+        result = _build_health(service_name, window, totals)
+        set_cache(f"health:{service_name}:{window}", result,
+                  ttl=HEALTH_TTL_SECONDS)
+        results.append(result)
+    return results
+
+
+async def _service_health(service_names: List[str], window: str):
+    results: Dict[str, Any] = {}
+    misses = []
+    for service_name in dict.fromkeys(service_names):
+        cached = get_cache(f"health:{service_name}:{window}")
+        if cached:
+            results[service_name] = cached
+        else:
+            misses.append(service_name)
+
+    if misses:
+        # tuple 當 key：service 名稱本身含逗號也不會撞到別的 batch
+        fetched = await single_flight(
+            ("health", window, tuple(misses)),
+            lambda: _refresh_health(misses, window),
+        )
+        results.update(zip(misses, fetched))
+
+    return [results[service_name] for service_name in service_names]
+
+
+@app.post("/mcp/get_service_health")
+async def get_service_health(req: HealthReq, response: Response):
+    """
+    Analyze App Runner service health based on CloudWatch metrics.
+    """
+    (result,) = await _service_health([req.service_name], req.window)
+    response.headers["Cache-Control"] = HEALTH_CACHE_CONTROL
     return result
 
 
+@app.post("/mcp/get_service_health_batch")
+async def get_service_health_batch(req: HealthBatchReq, response: Response):
+    """
+    Analyze several App Runner services with batched CloudWatch queries.
+    """
+    services = await _service_health(req.service_names, req.window)
+    response.headers["Cache-Control"] = HEALTH_CACHE_CONTROL
+    return {"services": services}
+
+
 # =====================================================
 # Tool 2️⃣ Cost Projection (AWS Cost Explorer)
 # =====================================================
-@app.post("/mcp/get_cost_projection")
-def get_cost_projection(payload: dict = Body(...)):
-    """
-    Estimate monthly cost trend using Cost Explorer.
-    """
-    timeframe = payload.get("timeframe", "7d")
+_COST_DRIVERS = ("traffic_increase",)
+_COST_ACTIONS = (
+    "Review App Runner instance size",
+    "Check idle concurrency",
+    "Introduce caching or request batching",
+)
 
-    cache_key = f"cost:{timeframe}"
-    cached = get_cache(cache_key)
-    if cached:
-        return cached
 
-    ce = get_cost_explorer()
+def _r2(x: float) -> float:
+    # 金額取到小數兩位（四捨五入），比 round() 的浮點十進位處理便宜
+    return math.floor(x * 100.0 + 0.5) / 100.0
 
-    today = datetime.utcnow().date()
-    start_date = today - timedelta(days=7)
 
-    resp = ce.get_cost_and_usage(
-        TimePeriod={
-            "Start": start_date.isoformat(),
-            "End": today.isoformat(),
-        },
-        Granularity="DAILY",
-        Metrics=["UnblendedCost"],
-    )
+# 每日成本：已結算的日子抓一次就留著，只有最近幾天（AWS 仍可能回補）每次重抓
+COST_SETTLE_DAYS = 2
+_DAILY_COST: Dict[date, float] = {}
+
 
-    daily_costs = [
-        float(day["Total"]["UnblendedCost"]["Amount"])
-        for day in resp["ResultsByTime"]
+async def _daily_costs(start_date: date, end_date: date) -> List[float]:
+    """
+    Daily UnblendedCost for [start_date, end_date), fetching only the days
+    not already held in _DAILY_COST with a single Cost Explorer call.
+    """
+    days = [
+        start_date + timedelta(days=i)
+        for i in range((end_date - start_date).days)
+    ]
+    missing = [d for d in days if d not in _DAILY_COST]
+
+    fresh: Dict[date, float] = {}
+    if missing:
+        async with get_cost_explorer() as ce:
+            resp = await ce.get_cost_and_usage(
+                TimePeriod={
+                    "Start": missing[0].isoformat(),
+                    "End": end_date.isoformat(),
+                },
+                Granularity="DAILY",
+                Metrics=["UnblendedCost"],
+            )
+
+        settled_before = end_date - timedelta(days=COST_SETTLE_DAYS)
+        for day in resp["ResultsByTime"]:
+            d = date.fromisoformat(day["TimePeriod"]["Start"])
+            amount = float(day["Total"]["UnblendedCost"]["Amount"])
+            fresh[d] = amount
+            if d < settled_before:
+                _DAILY_COST[d] = amount
+
+        # 超過最長 window 的日子用不到了
+        oldest = end_date - _WINDOWS["30d"]
+        for d in [d for d in _DAILY_COST if d < oldest]:
+            del _DAILY_COST[d]
+
+    return [
+        _DAILY_COST[d] if d in _DAILY_COST else fresh[d]
+        for d in days
+        if d in _DAILY_COST or d in fresh
     ]
 
-    total_cost = sum(daily_costs)
-    avg_daily = total_cost / len(daily_costs)
+
+def _cost_cache_key(timeframe: str) -> str:
+    # 以日期分桶：跨日後自動換新 key
+    return f"cost:{datetime.now(timezone.utc).date().isoformat()}:{timeframe}"
+
+
+async def _fetch_cost(timeframe: str):
+    today = datetime.now(timezone.utc).date()
+    # Cost Explorer 以天為單位，至少抓一天
+    start_date = today - timedelta(days=max(1, _WINDOWS[timeframe].days))
+
+    total_cost = 0.0
+    days = 0
+    for amount in await _daily_costs(start_date, today):
+        total_cost += amount
+        days += 1
+    avg_daily = total_cost / days if days else 0.0
     projected_monthly = avg_daily * 30
 
     result = {
         "timeframe": timeframe,
-        "current_cost_usd": round(total_cost, 2),
-        "average_daily_usd": round(avg_daily, 2),
-        "projected_monthly_usd": round(projected_monthly, 2),
+        "current_cost_usd": _r2(total_cost),
+        "average_daily_usd": _r2(avg_daily),
+        "projected_monthly_usd": _r2(projected_monthly),
         "baseline_monthly_usd": 30,
-        "burn_rate": round(projected_monthly / 30, 2),
+        "burn_rate": _r2(projected_monthly / 30),
         "anomaly": projected_monthly > 45,
-        "drivers": ["traffic_increase"],
-        "recommended_actions": [
-            "Review App Runner instance size",
-            "Check idle concurrency",
-            "Introduce caching or request batching",
-        ],
+        "drivers": _COST_DRIVERS,
+        "recommended_actions": _COST_ACTIONS,
     }
 
-    set_cache(cache_key, result)
+    set_cache(_cost_cache_key(timeframe), result, ttl=COST_TTL_SECONDS)
     return result
 
 
+async def _cost_projection(timeframe: str):
+    cache_key = _cost_cache_key(timeframe)
+    cached = get_cache(cache_key)
+    if cached:
+        return cached
+
+    return await single_flight(cache_key, lambda: _fetch_cost(timeframe))
+
+
+@app.post("/mcp/get_cost_projection")
+async def get_cost_projection(req: CostReq, response: Response):
+    """
+    Estimate monthly cost trend using Cost Explorer.
+    """
+    response.headers["Cache-Control"] = COST_CACHE_CONTROL
+    return await _cost_projection(req.timeframe)
+
+
+# =====================================================
+# Tool 3️⃣ Overview (health + cost 並行)
+# =====================================================
+class OverviewReq(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+
+    service_name: ServiceName
+    window: Window = "1h"
+    timeframe: Window = "7d"
+
+
+@app.post("/mcp/overview")
+async def overview(req: OverviewReq, response: Response):
+    """
+    Service health and cost projection in one call; the CloudWatch and
+    Cost Explorer requests run concurrently.
+    """
+    (health, ), cost = await asyncio.gather(
+        _service_health([req.service_name], req.window),
+        _cost_projection(req.timeframe),
+    )
+    # 以較短的 health TTL 為準
+    response.headers["Cache-Control"] = HEALTH_CACHE_CONTROL
+    return {"health": health, "cost": cost}
+
+
+# =====================================================
+# Cache invalidation（給 CI/CD、autoscaling hook 用）
+# =====================================================
+class InvalidateReq(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+
+    prefix: str = ""
+
+
+@app.post("/mcp/_invalidate")
+async def invalidate(req: InvalidateReq, authorization: str = Header(None)):
+    """
+    Drop cached tool results whose key starts with `prefix`
+    (e.g. "health:my-service:"); an empty prefix clears everything.
+    Prefixes covering "cost:" also drop the settled daily costs.
+    """
+    if not MCP_ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not authorization or not hmac.compare_digest(
+        authorization.encode("utf-8"), f"Bearer {MCP_ADMIN_TOKEN}".encode("utf-8")
+    ):
+        raise HTTPException(status_code=403, detail="Invalid token")
+
+    # 涵蓋 cost: 時連已結算的每日成本一起丟（AWS 回補 / credit 後才看得到新數字）
+    if "cost:".startswith(req.prefix) or req.prefix.startswith("cost:"):
+        _DAILY_COST.clear()
+
+    return {"prefix": req.prefix, "invalidated": invalidate_cache(req.prefix)}
+
+
 # =====================================================
 # Health Check (給 App Runner / ALB 用)
 # =====================================================